@@ -0,0 +1,201 @@
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# =============================================================================
+# Teste de carga da API (main.py)
+# Recomendado rodar a API com o mercado simulado para não depender da Binance/CBOE:
+#   UPSTREAM_MODE=simulated SIM_LATENCY_MS=150 uvicorn main:app --port 8080
+#   python bitcoin_teste_carga.py --dashboard-clients 50 --predict-rps 20 --duration 60
+# =============================================================================
+
+# Resultados: nome da operação -> lista de (latência em ms, sucesso)
+results = defaultdict(list)
+results_lock = threading.Lock()
+
+# Disparos com taxa fixa que perderam o horário por falta de worker livre
+dropped = Counter()
+
+
+def record(name, elapsed_ms, ok):
+    with results_lock:
+        results[name].append((elapsed_ms, ok))
+
+
+def call(session, method, url, name, scheduled_at=None):
+    """
+    Faz uma requisição e registra latência e sucesso.
+    Com `scheduled_at`, a latência conta a partir do horário previsto de envio,
+    incluindo a espera na fila (evita coordinated omission).
+    A API devolve 200 com {"error": ...} em caso de falha, então o corpo também é verificado.
+    """
+    start = scheduled_at if scheduled_at is not None else time.perf_counter()
+    ok = False
+    try:
+        response = session.request(method, url, timeout=30)
+        ok = response.ok and "error" not in response.json()
+    except Exception:
+        ok = False
+    record(name, (time.perf_counter() - start) * 1000, ok)
+    return ok
+
+
+# -----------------------------------------------------------------------------
+# Padrões de uso
+# -----------------------------------------------------------------------------
+def dashboard_client(base_url, interval, stop_event):
+    """
+    Reproduz o carregamento do dashboard (script.js: loadMarketData):
+    GET /market-data seguido de GET /vix-current-price, repetido a cada `interval` segundos.
+    """
+    session = requests.Session()
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        ok = call(session, "GET", f"{base_url}/market-data", "GET /market-data")
+        if ok:
+            call(session, "GET", f"{base_url}/vix-current-price", "GET /vix-current-price")
+        record("dashboard (carga completa)", (time.perf_counter() - start) * 1000, ok)
+        stop_event.wait(max(interval - (time.perf_counter() - start), 0))
+
+
+def paced_caller(base_url, method, path, rate, workers, stop_event):
+    """
+    Dispara `rate` requisições por segundo (taxa fixa, independente da latência).
+    No máximo `workers` requisições ficam em andamento; um disparo sem worker livre
+    no seu horário é descartado e contado em `dropped`, em vez de formar fila sem limite.
+    """
+    if rate <= 0:
+        return
+    # requests.Session não é thread-safe: uma sessão (e conexão reaproveitada) por worker,
+    # como nos clientes do dashboard, para não medir abertura de conexão a cada chamada
+    local = threading.local()
+    name = f"{method} {path}"
+    url = f"{base_url}{path}"
+    slots = threading.BoundedSemaphore(workers)
+
+    def fire(scheduled_at):
+        try:
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            call(local.session, method, url, name, scheduled_at)
+        finally:
+            slots.release()
+
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while not stop_event.is_set():
+            if slots.acquire(blocking=False):
+                executor.submit(fire, next_at)
+            else:
+                with results_lock:
+                    dropped[name] += 1
+            next_at += interval
+            stop_event.wait(max(next_at - time.perf_counter(), 0))
+    finally:
+        # Não drena fila ao final; só as requisições já em andamento terminam
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def refresh_caller(base_url, interval, stop_event):
+    if interval <= 0:
+        return
+    session = requests.Session()
+    while not stop_event.wait(interval):
+        call(session, "POST", f"{base_url}/refresh-cache", "POST /refresh-cache")
+
+
+def fetch_upstream_calls(base_url):
+    """
+    Lê /debug/upstream-calls. Retorna None se o endpoint não estiver acessível
+    (ex.: API em UPSTREAM_MODE=live sem profiling liberado).
+    """
+    try:
+        response = requests.get(f"{base_url}/debug/upstream-calls", timeout=10)
+        if not response.ok:
+            return None
+        return response.json().get("calls", {})
+    except Exception:
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Relatório
+# -----------------------------------------------------------------------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[index]
+
+
+def print_report(duration, calls_before, calls_after):
+    print(f"\nDuração: {duration:.1f}s\n")
+    header = f"{'operação':<28}{'total':>8}{'erros':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name in sorted(results):
+        samples = results[name]
+        latencies = sorted(elapsed for elapsed, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        print(
+            f"{name:<28}{len(samples):>8}{errors:>8}{len(samples) / duration:>9.1f}"
+            f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}"
+        )
+
+    for name in sorted(dropped):
+        print(f"\n{name}: {dropped[name]} disparos descartados (todos os workers ocupados no horário).")
+
+    if calls_before is None or calls_after is None:
+        print("\nChamadas às fontes externas: indisponível (/debug/upstream-calls).")
+        return
+    print("\nChamadas às fontes externas durante o teste:")
+    for name in sorted(calls_after):
+        delta = calls_after[name] - calls_before.get(name, 0)
+        print(f"  {name:<26}{delta:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API do dashboard de Bitcoin.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--duration", type=float, default=30, help="Duração do teste em segundos.")
+    parser.add_argument("--dashboard-clients", type=int, default=10, help="Clientes simultâneos do dashboard.")
+    parser.add_argument("--dashboard-interval", type=float, default=5, help="Segundos entre recargas de cada cliente.")
+    parser.add_argument("--predict-rps", type=float, default=5, help="Chamadas por segundo a POST /predict.")
+    parser.add_argument("--predict-workers", type=int, default=16, help="Threads para disparar POST /predict.")
+    parser.add_argument("--refresh-interval", type=float, default=0,
+                        help="Segundos entre chamadas a POST /refresh-cache (0 desativa).")
+    args = parser.parse_args()
+
+    calls_before = fetch_upstream_calls(args.base_url)
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=dashboard_client, args=(args.base_url, args.dashboard_interval, stop_event))
+        for _ in range(args.dashboard_clients)
+    ]
+    threads.append(threading.Thread(
+        target=paced_caller,
+        args=(args.base_url, "POST", "/predict", args.predict_rps, args.predict_workers, stop_event),
+    ))
+    threads.append(threading.Thread(target=refresh_caller, args=(args.base_url, args.refresh_interval, stop_event)))
+
+    print(f"Iniciando teste de carga em {args.base_url} por {args.duration:.0f}s...")
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    # A duração termina no fim do teste, não após as requisições em andamento
+    duration = time.perf_counter() - start
+    for t in threads:
+        t.join()
+
+    print_report(duration, calls_before, fetch_upstream_calls(args.base_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,18 @@
 import os
 import time
+import threading
 import joblib
 import logging
 import pandas as pd
 from datetime import datetime, timedelta
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import ccxt
-import requests
+from fastapi.responses import JSONResponse, PlainTextResponse
 from io import StringIO
 
+import profiler
+from upstream import UPSTREAM_MODE, create_exchange, fetch_vix_csv, get_upstream_calls
+
 # Configurações de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,18 +20,29 @@ logger = logging.getLogger(__name__)
 # Nome do arquivo de cache
 CACHE_FILE = "market_data_cache.pkl"
 
+# Arquivo do pipeline (modelo) treinado
+MODEL_FILE = "bitcoin_model.pkl"
+
+# Modo de inicialização rápida: a API sobe imediatamente e o modelo/cache
+# são carregados em segundo plano (ver warm_up)
+FAST_START = os.getenv("FAST_START", "0") == "1"
+
+# Espera (em segundos) entre tentativas do warm_up: dobra a cada falha até o máximo
+WARMUP_RETRY_INITIAL_SECONDS = float(os.getenv("WARMUP_RETRY_INITIAL_SECONDS", "5"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+
 # Objetos globais
+pipeline = None  # carregado por load_pipeline()
 cached_market_data = None  # DataFrame (BTC + VIX)
+cache_updated_at = None  # quando o cached_market_data foi gerado (naive)
+warmup_status = {"state": "pending", "error": None}
+cache_lock = threading.Lock()  # serializa a troca do dataset e a escrita do CACHE_FILE
 cached_current_prices = {"btc": None, "vix": None}
 last_fetched_time = {"btc": None, "vix": None}
 
 # Intervalo de tempo mínimo (em minutos) para atualizar cotações "ao vivo"
 LIVE_PRICE_INTERVAL_MINUTES = 60
 
-# Carrega seu pipeline (modelo) treinado
-logger.info("Carregando o pipeline treinado...")
-pipeline = joblib.load("bitcoin_model.pkl")
-
 # Colunas usadas no modelo
 FEATURE_COLUMNS = [
     "open_ma3",
@@ -54,6 +68,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _profiling_authorized(request: Request):
+    client_host = request.client.host if request.client else None
+    return profiler.is_authorized(request.headers.get("x-profile-token"), client_host)
+
+
+# Perfil sob demanda por requisição (header "X-Profile: 1" ou query "?profile=1").
+# O middleware só é registrado com PROFILING_ENABLED=1, sem custo quando desligado.
+if profiler.PROFILING_ENABLED:
+    logger.info("Profiling habilitado (PROFILING_ENABLED=1).")
+
+    @app.middleware("http")
+    async def profile_request_middleware(request: Request, call_next):
+        wants_profile = (
+            request.headers.get("x-profile") == "1"
+            or request.query_params.get("profile") == "1"
+        )
+        if not wants_profile or not _profiling_authorized(request):
+            return await call_next(request)
+
+        profile_id = profiler.new_profile_id()
+        token = profiler.requested_profile_id.set(profile_id)
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.requested_profile_id.reset(token)
+        # Só endpoints com profile_section geram perfil (e só perfis com amostras são úteis)
+        profile = profiler.get_profile(profile_id)
+        if profile is not None and profile["samples"] > 0:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+
 # ======================================
 # FUNÇÕES DE APOIO PARA BTC
 # ======================================
@@ -65,7 +111,7 @@ def fetch_btc_ohlcv_daily_until_yesterday(symbol="BTC/USDT", days=10):
     Tudo em timestamps naive (sem timezone).
     """
     logger.info("fetch_btc_ohlcv_daily_until_yesterday...")
-    exchange = ccxt.binance()
+    exchange = create_exchange()
 
     # data "de hoje" em naive
     end_dt = datetime.utcnow().date()  
@@ -96,7 +142,7 @@ def fetch_btc_partial_candle_today(symbol="BTC/USDT"):
     """
     logger.info("fetch_btc_partial_candle_today: construindo candle parcial do dia atual...")
 
-    exchange = ccxt.binance()
+    exchange = create_exchange()
 
     # data de hoje (naive)
     today_date = datetime.utcnow().date()
@@ -175,7 +221,7 @@ def fetch_live_btc_price():
             return cached_current_prices["btc"]
 
     try:
-        exchange = ccxt.binance()
+        exchange = create_exchange()
         ticker = exchange.fetch_ticker("BTC/USDT")
         last_price = ticker.get("last")
         logger.info(f"fetch_live_btc_price => ticker = {ticker}")
@@ -198,11 +244,7 @@ def fetch_vix_data(days=30):
     Busca dados do VIX (CSV oficial da CBOE) e filtra pelos últimos X dias.
     Tudo naive. Calcula colunas vix_open_ma3 etc. e insere 'date'.
     """
-    url = "https://cdn.cboe.com/api/global/us_indices/daily_prices/VIX_History.csv"
-    response = requests.get(url)
-    response.raise_for_status()
-
-    csv_data = StringIO(response.text)
+    csv_data = StringIO(fetch_vix_csv())
     vix_raw = pd.read_csv(csv_data)
 
     # Ajusta colunas
@@ -320,17 +362,124 @@ def process_and_merge_data(days=10):
     return merged
 
 
-def load_cache_from_file():
-    global cached_market_data
-    if os.path.exists(CACHE_FILE):
+def load_pipeline():
+    global pipeline
+    logger.info("Carregando o pipeline treinado...")
+    pipeline = joblib.load(MODEL_FILE)
+
+
+def load_cache_snapshot():
+    """
+    Carrega o último dataset persistido em disco, se existir.
+    Não sobrescreve um dataset já em memória (ex.: um /refresh-cache que terminou
+    antes do warm_up), que é sempre mais novo que o snapshot.
+    Retorna True se houver dataset disponível ao final.
+    """
+    global cached_market_data, cache_updated_at
+    with cache_lock:
+        if cached_market_data is not None:
+            return True
+        if not os.path.exists(CACHE_FILE):
+            return False
         logger.info("Carregando cache existente do disco.")
         with open(CACHE_FILE, "rb") as f:
             cached_market_data = joblib.load(f)
-    else:
+        cache_updated_at = datetime.utcfromtimestamp(os.path.getmtime(CACHE_FILE))  # naive
+        return True
+
+
+def rebuild_cache():
+    """
+    Regera o dataset a partir das fontes externas e persiste em disco.
+    """
+    global cached_market_data, cache_updated_at
+    new_data = process_and_merge_data(days=10)
+
+    # warm_up e /refresh-cache podem rodar juntos: grava num arquivo temporário
+    # e troca de forma atômica, para nunca deixar um pickle truncado no disco
+    with cache_lock:
+        cached_market_data = new_data
+        cache_updated_at = datetime.utcnow()  # naive
+        tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            joblib.dump(new_data, f)
+        os.replace(tmp_file, CACHE_FILE)
+
+
+def cache_is_stale():
+    """
+    O dataset está defasado se não existe ou se o último candle não é de hoje.
+    """
+    if cached_market_data is None or cached_market_data.empty:
+        return True
+    return cached_market_data.iloc[-1]["date"] < datetime.utcnow().date()
+
+
+def load_cache_from_file():
+    if not load_cache_snapshot():
         logger.info("Cache não encontrado. Gerando dados iniciais.")
-        cached_market_data = process_and_merge_data(days=10)
-        with open(CACHE_FILE, "wb") as f:
-            joblib.dump(cached_market_data, f)
+        rebuild_cache()
+
+
+def _warm_up_attempt():
+    """
+    Uma tentativa do warm_up. Cada etapa falha de forma independente;
+    retorna True quando o modelo está carregado e o dataset está em dia.
+    """
+    errors = []
+
+    if pipeline is None:
+        try:
+            load_pipeline()
+        except Exception as e:
+            errors.append(f"modelo: {e}")
+
+    if cache_is_stale():
+        try:
+            logger.info("warm_up => Cache ausente ou defasado. Regerando dataset.")
+            rebuild_cache()
+        except Exception as e:
+            errors.append(f"dataset: {e}")
+
+    if errors:
+        warmup_status["error"] = "; ".join(errors)
+        return False
+
+    fetch_live_btc_price()
+    fetch_live_vix_price()
+    warmup_status["error"] = None
+    return True
+
+
+def warm_up():
+    """
+    Inicialização em segundo plano (FAST_START=1):
+      1) carrega o snapshot do disco, que já passa a ser servido;
+      2) carrega o modelo;
+      3) regera o dataset se o snapshot não existir ou estiver defasado;
+      4) busca as cotações "ao vivo".
+    As etapas 2 e 3 são repetidas com backoff exponencial até darem certo, então uma
+    queda temporária da Binance/CBOE não deixa o /readyz em 503 para sempre.
+    Enquanto isso, o snapshot (se houver) continua sendo servido.
+    """
+    warmup_status["state"] = "running"
+    with profiler.profile_section("startup"):
+        try:
+            load_cache_snapshot()
+        except Exception as e:
+            logger.error(f"Erro ao carregar o snapshot do cache: {e}")
+        done = _warm_up_attempt()
+
+    delay = WARMUP_RETRY_INITIAL_SECONDS
+    while not done:
+        warmup_status["state"] = "retrying"
+        logger.error(f"Erro no warm_up ({warmup_status['error']}). Nova tentativa em {delay:.0f}s.")
+        time.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+        done = _warm_up_attempt()
+
+    warmup_status["state"] = "done"
+    logger.info("warm_up => Inicialização concluída.")
 
 
 # ======================================
@@ -338,11 +487,50 @@ def load_cache_from_file():
 # ======================================
 @app.on_event("startup")
 def startup_event():
-    # Carrega cache ou processa inicial
-    load_cache_from_file()
-    # Já busca cotações "ao vivo"
-    fetch_live_btc_price()
-    fetch_live_vix_price()
+    if FAST_START:
+        # Não bloqueia o bind do servidor: modelo e cache carregam em segundo plano
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+        return
+
+    with profiler.profile_section("startup"):
+        # Carrega modelo e cache (ou processa inicial)
+        load_pipeline()
+        load_cache_from_file()
+        # Já busca cotações "ao vivo"
+        fetch_live_btc_price()
+        fetch_live_vix_price()
+    warmup_status["state"] = "done"
+
+
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: o processo está de pé e respondendo.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: pronto quando o modelo e algum dataset (mesmo o snapshot do disco) estão carregados.
+    Inclui o frescor dos dados; responde 503 enquanto não estiver pronto.
+    """
+    has_data = cached_market_data is not None and not cached_market_data.empty
+    ready = pipeline is not None and has_data
+    body = {
+        "ready": ready,
+        "warmup": warmup_status,
+        "model_loaded": pipeline is not None,
+        "data_loaded": has_data,
+        "last_candle_date": str(cached_market_data.iloc[-1]["date"]) if has_data else None,
+        "cache_updated_at": cache_updated_at.isoformat() if cache_updated_at else None,
+        "cache_age_seconds": (
+            round((datetime.utcnow() - cache_updated_at).total_seconds()) if cache_updated_at else None
+        ),
+        "stale": cache_is_stale(),
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
 
 
 @app.get("/market-data")
@@ -351,36 +539,37 @@ def market_data():
     Retorna dados do último candle (que pode ser parcial do dia atual),
     mais a cotação atual do BTC e do VIX (simulado).
     """
-    try:
-        global cached_market_data
-        if cached_market_data is None or cached_market_data.empty:
-            raise ValueError("Dados de mercado indisponíveis.")
-
-        last_row = cached_market_data.iloc[-1]
-        btc_current = fetch_live_btc_price()
-        vix_current = fetch_live_vix_price()
-
-        logger.info(f"/market-data => Candle final: open={last_row['open']}, close={last_row['close']}")
-        logger.info(f"   => Candle date = {last_row['timestamp']}")
-        logger.info(f"   => btc_current = {btc_current}")
-
-        # Exemplo: devolvendo open, close, current e etc.
-        return {
-            "date": str(last_row["date"]),
-            "btc_open": float(last_row["open"]) if last_row["open"] is not None else None,
-            "btc_close": float(last_row["close"]),
-            "btc_high": float(last_row["high"]) if last_row["high"] is not None else None,
-            "btc_low": float(last_row["low"]) if last_row["low"] is not None else None,
-            "btc_close_ma3": float(last_row["close_ma3"]),
-            "btc_current": float(btc_current) if btc_current else None,
-            "vix_open": float(last_row["vix_open"]),
-            "vix_close": float(last_row["vix_close"]),
-            "vix_current": float(vix_current) if vix_current else None,
-            "vix_close_ma3": float(last_row["vix_close_ma3"]),
-        }
-    except Exception as e:
-        logger.error(f"Erro em /market-data: {e}")
-        return {"error": str(e)}
+    with profiler.profile_section("market-data"):
+        try:
+            global cached_market_data
+            if cached_market_data is None or cached_market_data.empty:
+                raise ValueError("Dados de mercado indisponíveis.")
+
+            last_row = cached_market_data.iloc[-1]
+            btc_current = fetch_live_btc_price()
+            vix_current = fetch_live_vix_price()
+
+            logger.info(f"/market-data => Candle final: open={last_row['open']}, close={last_row['close']}")
+            logger.info(f"   => Candle date = {last_row['timestamp']}")
+            logger.info(f"   => btc_current = {btc_current}")
+
+            # Exemplo: devolvendo open, close, current e etc.
+            return {
+                "date": str(last_row["date"]),
+                "btc_open": float(last_row["open"]) if last_row["open"] is not None else None,
+                "btc_close": float(last_row["close"]),
+                "btc_high": float(last_row["high"]) if last_row["high"] is not None else None,
+                "btc_low": float(last_row["low"]) if last_row["low"] is not None else None,
+                "btc_close_ma3": float(last_row["close_ma3"]),
+                "btc_current": float(btc_current) if btc_current else None,
+                "vix_open": float(last_row["vix_open"]),
+                "vix_close": float(last_row["vix_close"]),
+                "vix_current": float(vix_current) if vix_current else None,
+                "vix_close_ma3": float(last_row["vix_close_ma3"]),
+            }
+        except Exception as e:
+            logger.error(f"Erro em /market-data: {e}")
+            return {"error": str(e)}
 
 
 @app.get("/vix-current-price")
@@ -402,25 +591,22 @@ def refresh_cache():
     """
     Regera o dataset e zera o cache de preços ao vivo
     """
-    global cached_market_data, cached_current_prices, last_fetched_time
-    try:
-        logger.info("refresh_cache => Recriando dataset.")
-        new_data = process_and_merge_data(days=10)
-        cached_market_data = new_data
-
-        with open(CACHE_FILE, "wb") as f:
-            joblib.dump(cached_market_data, f)
+    global cached_current_prices, last_fetched_time
+    with profiler.profile_section("refresh-cache"):
+        try:
+            logger.info("refresh_cache => Recriando dataset.")
+            rebuild_cache()
 
-        # Zera cache
-        cached_current_prices = {"btc": None, "vix": None}
-        last_fetched_time = {"btc": None, "vix": None}
-        fetch_live_btc_price()
-        fetch_live_vix_price()
+            # Zera cache
+            cached_current_prices = {"btc": None, "vix": None}
+            last_fetched_time = {"btc": None, "vix": None}
+            fetch_live_btc_price()
+            fetch_live_vix_price()
 
-        return {"message": "Cache atualizado com sucesso."}
-    except Exception as e:
-        logger.error(f"Erro em /refresh-cache: {e}")
-        return {"error": str(e)}
+            return {"message": "Cache atualizado com sucesso."}
+        except Exception as e:
+            logger.error(f"Erro em /refresh-cache: {e}")
+            return {"error": str(e)}
 
 
 @app.post("/predict")
@@ -431,23 +617,90 @@ def predict():
     (que pode ser parcial do dia atual).
     """
     global cached_market_data
-    try:
-        if cached_market_data is None or cached_market_data.empty:
-            raise ValueError("Dados indisponíveis para previsão.")
-
-        missing_cols = [c for c in FEATURE_COLUMNS if c not in cached_market_data.columns]
-        if missing_cols:
-            raise ValueError(f"Colunas ausentes: {missing_cols}")
-
-        X = cached_market_data[FEATURE_COLUMNS].iloc[[-1]].fillna(0)
-        prediction = pipeline.predict(X)[0]
-        return {
-            "date": datetime.utcnow().strftime("%Y-%m-%d"),  # naive
-            "predicted_class": int(prediction),
-        }
-    except Exception as e:
-        logger.error(f"Erro em /predict: {e}")
-        return {"error": str(e)}
+    with profiler.profile_section("predict"):
+        try:
+            if pipeline is None:
+                raise ValueError("Modelo ainda não carregado.")
+            if cached_market_data is None or cached_market_data.empty:
+                raise ValueError("Dados indisponíveis para previsão.")
+
+            missing_cols = [c for c in FEATURE_COLUMNS if c not in cached_market_data.columns]
+            if missing_cols:
+                raise ValueError(f"Colunas ausentes: {missing_cols}")
+
+            X = cached_market_data[FEATURE_COLUMNS].iloc[[-1]].fillna(0)
+            prediction = pipeline.predict(X)[0]
+            return {
+                "date": datetime.utcnow().strftime("%Y-%m-%d"),  # naive
+                "predicted_class": int(prediction),
+            }
+        except Exception as e:
+            logger.error(f"Erro em /predict: {e}")
+            return {"error": str(e)}
+
+
+@app.get("/debug/upstream-calls")
+def upstream_calls(request: Request):
+    """
+    Contagem de chamadas à Binance/CBOE (ou aos substitutos) desde o início do processo.
+    Usado pelo teste de carga para medir a eficácia do cache. Em UPSTREAM_MODE=live
+    (produção) segue as mesmas regras de acesso dos endpoints de profiling.
+    """
+    if UPSTREAM_MODE == "live":
+        _check_profiling_access(request)
+    return {"mode": UPSTREAM_MODE, "calls": get_upstream_calls()}
+
+
+# ======================================
+# ENDPOINTS DE PROFILING (PROFILING_ENABLED=1)
+# ======================================
+def _check_profiling_access(request: Request):
+    """
+    Os endpoints de debug respondem 404 com o profiling desligado e 403 se o token
+    não conferir (ou, sem PROFILING_TOKEN, se o cliente não for local).
+    """
+    if not profiler.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _profiling_authorized(request):
+        raise HTTPException(status_code=403, detail="Acesso ao profiling negado.")
+
+
+@app.post("/debug/profile")
+def arm_profiling(request: Request, section: str = "refresh-cache", runs: int = 1):
+    """
+    Perfila as próximas N execuções de uma seção (refresh-cache, predict ou market-data),
+    somadas num único perfil.
+    """
+    _check_profiling_access(request)
+    if section not in profiler.ARMABLE_SECTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Seção inválida: {section}. Opções: {', '.join(profiler.ARMABLE_SECTIONS)}.",
+        )
+    profile_id = profiler.arm_section(section, runs)
+    logger.info(f"/debug/profile => próximas {runs} execuções de {section} serão perfiladas ({profile_id}).")
+    return {"profile_id": profile_id, "armed": profiler.armed_sections()}
+
+
+@app.get("/debug/profile")
+def list_profiles(request: Request):
+    """
+    Lista os perfis capturados (sem as pilhas) e as seções ainda armadas.
+    """
+    _check_profiling_access(request)
+    return {"armed": profiler.armed_sections(), "profiles": profiler.list_profiles()}
+
+
+@app.get("/debug/profile/{profile_id}", response_class=PlainTextResponse)
+def get_profile(request: Request, profile_id: str):
+    """
+    Retorna as pilhas no formato "collapsed", pronto para flamegraph.pl ou speedscope.
+    """
+    _check_profiling_access(request)
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    return PlainTextResponse(profile["collapsed"] + "\n")
 
 
 if __name__ == "__main__":
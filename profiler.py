@@ -0,0 +1,237 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# ======================================
+# CONFIGURAÇÃO
+# ======================================
+# O perfilador só é ativado explicitamente. Desligado, `profile_section`
+# custa apenas a checagem de um booleano.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+
+# Token exigido no header X-Profile-Token. Sem token, só clientes locais (loopback) têm acesso.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") or None
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+# Intervalo entre amostras (em milissegundos)
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+if PROFILING_INTERVAL_MS <= 0:
+    # Com intervalo zero a thread de amostragem ficaria em loop ocupado, segurando o GIL
+    raise ValueError(f"PROFILING_INTERVAL_MS deve ser maior que zero (recebido: {PROFILING_INTERVAL_MS}).")
+
+# Quantidade máxima de perfis mantidos em memória
+PROFILING_MAX_RESULTS = int(os.getenv("PROFILING_MAX_RESULTS", "20"))
+
+# Perfila a inicialização (startup_event ou warm_up), que roda antes de qualquer requisição
+PROFILE_STARTUP = os.getenv("PROFILE_STARTUP", "0") == "1"
+
+# Id do perfil solicitado pela requisição corrente (definido pelo middleware).
+# O FastAPI copia o contexto para a threadpool, então o valor chega aos endpoints síncronos.
+requested_profile_id = contextvars.ContextVar("requested_profile_id", default=None)
+
+# Seções que podem ser armadas via POST /debug/profile
+# ("startup" roda antes de qualquer requisição e só é armada por PROFILE_STARTUP)
+ARMABLE_SECTIONS = ("refresh-cache", "predict", "market-data")
+
+# Perfis concluídos (mais recentes no final)
+_results = deque(maxlen=PROFILING_MAX_RESULTS)
+_results_lock = threading.Lock()
+
+# Execuções futuras de cada seção a perfilar, somadas num único perfil
+# (ex.: {"predict": {"remaining": 50, "profile_id": "..."}})
+_armed_sections = {}
+if PROFILING_ENABLED and PROFILE_STARTUP:
+    _armed_sections["startup"] = {"remaining": 1, "profile_id": uuid.uuid4().hex[:12]}
+
+
+# ======================================
+# AMOSTRADOR
+# ======================================
+class StackSampler:
+    """
+    Perfilador por amostragem: uma thread auxiliar lê periodicamente a pilha
+    da thread alvo (via sys._current_frames) e conta as pilhas observadas.
+    O resultado sai no formato "collapsed" (frame;frame;frame contagem),
+    aceito diretamente por flamegraph.pl, speedscope e inferno.
+    """
+
+    def __init__(self, thread_id, interval_ms=PROFILING_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Amostra final: seções mais curtas que o intervalo ainda registram a pilha
+        self._sample()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        self.stacks[_collapse_frame(frame)] += 1
+        self.samples += 1
+
+    def _run(self):
+        # Primeira amostra imediata, sem esperar um intervalo inteiro
+        self._sample()
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+def _collapsed(stacks):
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+def _collapse_frame(frame):
+    """
+    Converte a pilha em "arquivo:função;arquivo:função;..." (raiz primeiro).
+    Frames do próprio perfilador (amostras de início/fim da seção) são descartados.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    for i, name in enumerate(names):
+        if name.startswith("profiler.py:"):
+            names = names[:i]
+            if names and names[-1].startswith("contextlib.py:"):
+                names.pop()
+            break
+    return ";".join(names)
+
+
+# ======================================
+# API DO PERFILADOR
+# ======================================
+def new_profile_id():
+    return uuid.uuid4().hex[:12]
+
+
+def arm_section(section, count):
+    """
+    Marca as próximas `count` execuções de `section` para serem perfiladas.
+    Todas as execuções são somadas num único perfil, cujo id é retornado.
+    """
+    profile_id = new_profile_id()
+    with _results_lock:
+        _armed_sections[section] = {"remaining": max(int(count), 0), "profile_id": profile_id}
+    return profile_id
+
+
+def armed_sections():
+    with _results_lock:
+        return {
+            section: dict(armed) for section, armed in _armed_sections.items() if armed["remaining"] > 0
+        }
+
+
+def _take_armed(section):
+    with _results_lock:
+        armed = _armed_sections.get(section)
+        if armed and armed["remaining"] > 0:
+            armed["remaining"] -= 1
+            return armed["profile_id"]
+    return None
+
+
+def _store_profile(profile_id, section, sampler, elapsed_ms):
+    """
+    Guarda o resultado; execuções com o mesmo id (seção armada) são somadas.
+    """
+    with _results_lock:
+        for p in _results:
+            if p["id"] == profile_id:
+                p["stacks"].update(sampler.stacks)
+                p["samples"] += sampler.samples
+                p["duration_ms"] = round(p["duration_ms"] + elapsed_ms, 2)
+                p["runs"] += 1
+                return
+        _results.append({
+            "id": profile_id,
+            "section": section,
+            "created_at": datetime.utcnow().isoformat(),  # naive
+            "duration_ms": round(elapsed_ms, 2),
+            "runs": 1,
+            "samples": sampler.samples,
+            "stacks": Counter(sampler.stacks),
+        })
+
+
+@contextmanager
+def profile_section(section):
+    """
+    Perfila o bloco se a requisição corrente pediu um perfil (header/query)
+    ou se a seção foi armada (/debug/profile ou PROFILE_STARTUP). Caso contrário não faz nada.
+    """
+    if not PROFILING_ENABLED:
+        yield
+        return
+
+    profile_id = requested_profile_id.get()
+    if profile_id is None:
+        profile_id = _take_armed(section)
+    if profile_id is None:
+        yield
+        return
+
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _store_profile(profile_id, section, sampler, elapsed_ms)
+        logger.info(
+            f"profile_section => perfil {profile_id} de '{section}' "
+            f"({elapsed_ms:.1f} ms, {sampler.samples} amostras)."
+        )
+
+
+def list_profiles():
+    with _results_lock:
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in _results]
+
+
+def get_profile(profile_id):
+    """
+    Retorna o perfil com as pilhas já no formato "collapsed" (chave `collapsed`).
+    """
+    with _results_lock:
+        for p in _results:
+            if p["id"] == profile_id:
+                profile = {k: v for k, v in p.items() if k != "stacks"}
+                profile["collapsed"] = _collapsed(p["stacks"])
+                return profile
+    return None
+
+
+def is_authorized(token, client_host):
+    """
+    Com PROFILING_TOKEN definido, exige o token (comparação em tempo constante).
+    Sem token, aceita apenas clientes locais.
+    """
+    if PROFILING_TOKEN is None:
+        return client_host in LOOPBACK_HOSTS
+    return token is not None and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
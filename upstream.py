@@ -0,0 +1,336 @@
+import os
+import json
+import math
+import calendar
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+import ccxt
+import requests
+
+logger = logging.getLogger(__name__)
+
+# ======================================
+# CONFIGURAÇÃO
+# ======================================
+# URL oficial do histórico do VIX (CBOE)
+VIX_CSV_URL = "https://cdn.cboe.com/api/global/us_indices/daily_prices/VIX_History.csv"
+
+# Modo das fontes externas:
+#   "live"      -> Binance e CBOE reais (padrão)
+#   "record"    -> Binance e CBOE reais, gravando as respostas em UPSTREAM_FIXTURES_DIR
+#   "replay"    -> lê as respostas gravadas, sem acesso à rede
+#   "simulated" -> mercado sintético local (testes de carga / capacidade)
+UPSTREAM_MODES = ("live", "record", "replay", "simulated")
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live").lower()
+if UPSTREAM_MODE not in UPSTREAM_MODES:
+    # Um erro de digitação (ex.: "sim") cairia em silêncio na Binance/CBOE reais
+    raise ValueError(f"UPSTREAM_MODE inválido: {UPSTREAM_MODE!r}. Opções: {', '.join(UPSTREAM_MODES)}.")
+UPSTREAM_FIXTURES_DIR = os.getenv("UPSTREAM_FIXTURES_DIR", "fixtures")
+
+VIX_FIXTURE_FILE = "VIX_History.csv"
+FIXTURE_META_FILE = "meta.json"
+
+# Latência (em milissegundos) e taxa de erro injetadas nos modos "replay" e "simulated"
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", "0"))
+SIM_LATENCY_JITTER_MS = float(os.getenv("SIM_LATENCY_JITTER_MS", "0"))
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", "0"))
+# Latência do load_markets, feito pelo ccxt na primeira chamada de cada instância de exchange
+SIM_LOAD_MARKETS_LATENCY_MS = float(os.getenv("SIM_LOAD_MARKETS_LATENCY_MS", "0"))
+
+# Parâmetros do mercado sintético
+SIM_SEED = int(os.getenv("SIM_SEED", "42"))
+SIM_BTC_BASE_PRICE = float(os.getenv("SIM_BTC_BASE_PRICE", "95000"))
+SIM_VIX_BASE = float(os.getenv("SIM_VIX_BASE", "18"))
+
+# Contagem de chamadas às fontes externas (em todos os modos)
+upstream_calls = Counter()
+_calls_lock = threading.Lock()
+
+
+def _count_call(name):
+    with _calls_lock:
+        upstream_calls[name] += 1
+
+
+def get_upstream_calls():
+    with _calls_lock:
+        return dict(upstream_calls)
+
+
+def _fixture_path(name):
+    return os.path.join(UPSTREAM_FIXTURES_DIR, name)
+
+
+def _ccxt_fixture_name(method, symbol, timeframe=None, limit=None):
+    """
+    Nome do arquivo de uma chamada ccxt gravada. O `limit` distingue chamadas do mesmo
+    timeframe (ex.: candles diários dos últimos dias x candle de ontem). O `since` é
+    ignorado de propósito: no replay as datas são deslocadas para o dia atual.
+    """
+    parts = [method, symbol.replace("/", "_")]
+    if timeframe:
+        parts.append(timeframe)
+    if limit is not None:
+        parts.append(f"limit{limit}")
+    return "_".join(parts) + ".json"
+
+
+def _write_fixture(name, text):
+    os.makedirs(UPSTREAM_FIXTURES_DIR, exist_ok=True)
+    with open(_fixture_path(name), "w") as f:
+        f.write(text)
+    # Data da gravação, usada no replay para alinhar as datas com "hoje"
+    with open(_fixture_path(FIXTURE_META_FILE), "w") as f:
+        json.dump({"recorded_date": datetime.utcnow().date().isoformat()}, f)
+
+
+def _replay_shift_days():
+    """
+    Quantidade de dias entre a gravação e hoje (0 se a gravação não tiver meta.json).
+    """
+    path = _fixture_path(FIXTURE_META_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        recorded_date = date.fromisoformat(json.load(f)["recorded_date"])
+    return (datetime.utcnow().date() - recorded_date).days
+
+
+def _shift_vix_csv(text, days):
+    """
+    Desloca a coluna DATE (MM/DD/YYYY) do CSV da CBOE em `days` dias.
+    """
+    if days == 0:
+        return text
+    lines = text.splitlines()
+    shifted = [lines[0]]
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        date_str, rest = line.split(",", 1)
+        day = datetime.strptime(date_str.strip(), "%m/%d/%Y") + timedelta(days=days)
+        shifted.append(f"{day.strftime('%m/%d/%Y')},{rest}")
+    return "\n".join(shifted) + "\n"
+
+
+def _simulate_upstream(error_cls, latency_ms=None):
+    """
+    Aplica a latência e a taxa de erro configuradas (SIM_*) a uma chamada simulada.
+    """
+    if latency_ms is None:
+        latency_ms = SIM_LATENCY_MS
+    delay_ms = latency_ms + random.uniform(0, SIM_LATENCY_JITTER_MS)
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+    if SIM_ERROR_RATE > 0 and random.random() < SIM_ERROR_RATE:
+        raise error_cls("Falha simulada da fonte externa.")
+
+
+# ======================================
+# EXCHANGES
+# ======================================
+class CountingExchange:
+    """
+    Envolve uma exchange ccxt real e contabiliza as chamadas em `upstream_calls`.
+    """
+
+    def __init__(self, exchange):
+        self._exchange = exchange
+
+    def parse8601(self, value):
+        return self._exchange.parse8601(value)
+
+    def _count_load_markets(self):
+        # O ccxt baixa os mercados na primeira chamada de cada instância
+        if not self._exchange.markets:
+            _count_call("load_markets")
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None):
+        self._count_load_markets()
+        _count_call(f"fetch_ohlcv:{timeframe}")
+        return self._exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+
+    def fetch_ticker(self, symbol):
+        self._count_load_markets()
+        _count_call("fetch_ticker")
+        return self._exchange.fetch_ticker(symbol)
+
+
+class RecordingExchange(CountingExchange):
+    """
+    Além de contabilizar, grava em JSON as respostas de fetch_ohlcv/fetch_ticker.
+    """
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None):
+        ohlcv = super().fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        _write_fixture(_ccxt_fixture_name("ohlcv", symbol, timeframe, limit), json.dumps(ohlcv))
+        return ohlcv
+
+    def fetch_ticker(self, symbol):
+        ticker = super().fetch_ticker(symbol)
+        _write_fixture(_ccxt_fixture_name("ticker", symbol), json.dumps(ticker))
+        return ticker
+
+
+class OfflineExchange:
+    """
+    Base dos substitutos locais da Binance. Assim como uma instância nova do ccxt,
+    a primeira chamada de cada instância paga um load_markets (SIM_LOAD_MARKETS_LATENCY_MS).
+    """
+
+    def __init__(self):
+        self.markets = None  # como no ccxt: preenchido pelo load_markets
+
+    def parse8601(self, value):
+        return ccxt.Exchange.parse8601(value)
+
+    def _load_markets(self):
+        if self.markets is not None:
+            return
+        _count_call("load_markets")
+        _simulate_upstream(ccxt.NetworkError, SIM_LOAD_MARKETS_LATENCY_MS)
+        self.markets = {"BTC/USDT": {"symbol": "BTC/USDT", "base": "BTC", "quote": "USDT"}}
+
+    def _simulate_call(self, name):
+        self._load_markets()
+        _count_call(name)
+        _simulate_upstream(ccxt.NetworkError)
+
+
+class ReplayExchange(OfflineExchange):
+    """
+    Devolve as respostas gravadas por RecordingExchange, sem acesso à rede.
+    Os timestamps são deslocados em dias inteiros para que o dia da gravação vire "hoje",
+    e o dataset montado no replay tem o mesmo formato do montado na gravação.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._shift_ms = _replay_shift_days() * 86_400_000
+
+    def _load(self, name):
+        path = _fixture_path(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Fixture não encontrada: {path}")
+        with open(path) as f:
+            return json.load(f)
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None):
+        self._simulate_call(f"fetch_ohlcv:{timeframe}")
+        ohlcv = self._load(_ccxt_fixture_name("ohlcv", symbol, timeframe, limit))
+        return [[candle[0] + self._shift_ms] + candle[1:] for candle in ohlcv]
+
+    def fetch_ticker(self, symbol):
+        self._simulate_call("fetch_ticker")
+        ticker = self._load(_ccxt_fixture_name("ticker", symbol))
+        if ticker.get("timestamp") is not None:
+            ticker["timestamp"] += self._shift_ms
+        return ticker
+
+
+def _simulated_price(ts_ms, base):
+    """
+    Preço sintético determinístico em função do tempo: tendência de ~30 dias
+    mais um ciclo diário. Candles de timeframes diferentes ficam consistentes entre si.
+    """
+    t = ts_ms / 1000.0
+    month = math.sin(2 * math.pi * t / (30 * 86400) + SIM_SEED)
+    day = math.sin(2 * math.pi * t / 86400 + SIM_SEED / 2)
+    return base * math.exp(0.08 * month + 0.015 * day)
+
+
+class SimulatedExchange(OfflineExchange):
+    """
+    Substituto local da Binance compatível com os métodos ccxt usados pela API.
+    Sintetiza candles e ticker do BTC e aplica SIM_LATENCY_MS / SIM_ERROR_RATE.
+    """
+
+    def _candle(self, ts_ms, tf_ms):
+        rng = random.Random(SIM_SEED * 1_000_003 + ts_ms)
+        open_ = _simulated_price(ts_ms, SIM_BTC_BASE_PRICE)
+        close = _simulated_price(ts_ms + tf_ms, SIM_BTC_BASE_PRICE)
+        high = max(open_, close) * (1 + rng.uniform(0, 0.01))
+        low = min(open_, close) * (1 - rng.uniform(0, 0.01))
+        volume = rng.uniform(50, 150) * tf_ms / 3_600_000
+        return [ts_ms, round(open_, 2), round(high, 2), round(low, 2), round(close, 2), round(volume, 4)]
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None):
+        self._simulate_call(f"fetch_ohlcv:{timeframe}")
+
+        limit = limit or 500
+        tf_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        now_ms = int(time.time() * 1000)
+        if since is None:
+            since = now_ms - limit * tf_ms
+        start = since - since % tf_ms
+        # Assim como a Binance, inclui o candle em andamento e nada no futuro
+        end = min(now_ms, start + (limit - 1) * tf_ms)
+
+        return [self._candle(ts, tf_ms) for ts in range(start, end + 1, tf_ms)]
+
+    def fetch_ticker(self, symbol):
+        self._simulate_call("fetch_ticker")
+        now_ms = int(time.time() * 1000)
+        last = round(_simulated_price(now_ms, SIM_BTC_BASE_PRICE), 2)
+        return {"symbol": symbol, "timestamp": now_ms, "last": last, "close": last}
+
+
+def _simulated_vix_csv(days=90):
+    """
+    Gera um CSV no formato da CBOE (DATE,OPEN,HIGH,LOW,CLOSE) apenas com dias úteis.
+    """
+    rows = ["DATE,OPEN,HIGH,LOW,CLOSE"]
+    today = datetime.utcnow().date()
+    for offset in range(days, -1, -1):
+        day = today - timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        ts_ms = calendar.timegm(day.timetuple()) * 1000
+        rng = random.Random(SIM_SEED * 7_919 + ts_ms)
+        open_ = _simulated_price(ts_ms, SIM_VIX_BASE)
+        close = _simulated_price(ts_ms + 86_400_000, SIM_VIX_BASE)
+        high = max(open_, close) + rng.uniform(0, 1.5)
+        low = min(open_, close) - rng.uniform(0, 1.5)
+        rows.append(f"{day.strftime('%m/%d/%Y')},{open_:.2f},{high:.2f},{low:.2f},{close:.2f}")
+    return "\n".join(rows) + "\n"
+
+
+# ======================================
+# FÁBRICAS USADAS PELA API
+# ======================================
+def create_exchange():
+    """
+    Retorna a exchange (ou substituto compatível) conforme UPSTREAM_MODE.
+    """
+    if UPSTREAM_MODE == "simulated":
+        return SimulatedExchange()
+    if UPSTREAM_MODE == "replay":
+        return ReplayExchange()
+    if UPSTREAM_MODE == "record":
+        return RecordingExchange(ccxt.binance())
+    return CountingExchange(ccxt.binance())
+
+
+def fetch_vix_csv():
+    """
+    Retorna o texto do CSV histórico do VIX conforme UPSTREAM_MODE.
+    """
+    _count_call("fetch_vix_csv")
+    if UPSTREAM_MODE == "simulated":
+        _simulate_upstream(requests.ConnectionError)
+        return _simulated_vix_csv()
+    if UPSTREAM_MODE == "replay":
+        _simulate_upstream(requests.ConnectionError)
+        with open(_fixture_path(VIX_FIXTURE_FILE)) as f:
+            return _shift_vix_csv(f.read(), _replay_shift_days())
+
+    response = requests.get(VIX_CSV_URL)
+    response.raise_for_status()
+
+    if UPSTREAM_MODE == "record":
+        _write_fixture(VIX_FIXTURE_FILE, response.text)
+    return response.text